@@ -1,11 +1,13 @@
 import bpy
+import bmesh
 import os.path
+import numpy as np
 
 from math import radians
-from mathutils import Vector
 from functools import wraps
 from time import time
 from bpy_extras.io_utils import ExportHelper
+from bpy.app.handlers import persistent
 
 # ---------------- Addon Stuff ---------------- #
 
@@ -137,6 +139,8 @@ def register():
     for c in CLASSES:
         bpy.utils.register_class(c)
         
+    bpy.app.handlers.load_post.append(clear_caches)
+        
     
 def unregister():
     """
@@ -149,6 +153,8 @@ def unregister():
     for c in CLASSES:
         bpy.utils.unregister_class(c)
         
+    bpy.app.handlers.load_post.remove(clear_caches)
+        
         
         
 def ShowMessageBox(message = "", title = "Message Box", icon = 'INFO'):
@@ -164,6 +170,30 @@ def ShowMessageBox(message = "", title = "Message Box", icon = 'INFO'):
     bpy.context.window_manager.popup_menu(draw, title = title, icon = icon)
 
 # ---------------- Logic Stuff ---------------- #
+
+# Set to True to print debugging information (timings, dimensions) to the console.
+DEBUG = False
+
+# Names of the imported hanger meshes, keyed by (hanger type, hangers dir path).
+# The names are kept rather than the meshes themselves, since undo invalidates references to blender data.
+# The meshes are tagged with their key, so a different mesh that got the same name is never used.
+hanger_mesh_names = {}
+HANGER_KEY_TAG = 'holder_hanger_key'
+
+# The last generated holder shell, keyed by get_shell_key, as (name of a copy of its mesh, dimensions).
+# The copy is tagged with its key, so a different mesh that got the same name is never used.
+shell_cache = {}
+SHELL_KEY_TAG = 'holder_shell_key'
+
+@persistent
+def clear_caches(_):
+    """
+    Clears the caches when a file is loaded, since the cached meshes are not saved with the file.
+    """
+    hanger_mesh_names.clear()
+    shell_cache.clear()
+
+
 def timing(f):
     """
     Timing function, used for debugging.
@@ -173,43 +203,127 @@ def timing(f):
         ts = time()
         result = f(*args, **kw)
         te = time()
-        print('time: %2.4f sec \t func:%r' % (te-ts, f.__name__))
+        if DEBUG:
+            print('time: %2.4f sec \t func:%r' % (te-ts, f.__name__))
         return result
     return wrap
 
+def local_coords(target_object):
+    """
+    Returns the local coordinates of all the vertices of the target object as an (N, 3) array.
+    """
+    n = len(target_object.data.vertices)
+    coords = np.empty(n * 3, dtype=np.float32)
+    target_object.data.vertices.foreach_get("co", coords)
+    return coords.reshape(n, 3)
+
+
+def world_coords(target_object, coords=None):
+    """
+    Returns the world coordinates of all the vertices of the target object as an (N, 3) array.
+    :param coords: The local coordinates of the vertices, if they were already read.
+    """
+    if coords is None:
+        coords = local_coords(target_object)
+    
+    # Apply the world matrix to all the coordinates at once.
+    matrix = np.array(target_object.matrix_world, dtype=np.float32)
+    return coords @ matrix[:3, :3].T + matrix[:3, 3]
+
+
 @timing
 def get_mins_maxs(target_object):
     """
     Calculates the min and max values for all axes.
     Used to speed up the calculations anywhere this information is required.
     """
-    coords0 = target_object.matrix_world @ target_object.data.vertices[0].co
-    max_x = coords0.x
-    max_y = coords0.y
-    max_z = coords0.z
-    min_x = coords0.x
-    min_y = coords0.y
-    min_z = coords0.z
-    
-    for v in target_object.data.vertices:
-        coords = target_object.matrix_world @ v.co
-        max_x = max(coords.x, max_x)
-        max_y = max(coords.y, max_y)
-        max_z = max(coords.z, max_z)
-        min_x = min(coords.x, min_x)
-        min_y = min(coords.y, min_y)
-        min_z = min(coords.z, min_z)
+    coords = world_coords(target_object)
+    max_x, max_y, max_z = coords.max(axis=0).tolist()
+    min_x, min_y, min_z = coords.min(axis=0).tolist()
         
     return max_x, max_y, max_z, min_x, min_y, min_z
 
 
+def deselect_all():
+    """
+    Deselects all the objects.
+    """
+    for obj in bpy.context.selected_objects:
+        obj.select_set(False)
+
+
+def add_cube(name, size, location, scale, rotation=(0, 0, 0)):
+    """
+    Adds a cube object to the scene.
+    """
+    half = size / 2
+    vertices = [(x, y, z) for x in (-half, half) for y in (-half, half) for z in (-half, half)]
+    
+    # The faces are ordered so that all the normals point outwards.
+    faces = [(0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)]
+    
+    mesh = bpy.data.meshes.new(name)
+    mesh.from_pydata(vertices, [], faces)
+    mesh.update()
+    
+    cube = bpy.data.objects.new(name, mesh)
+    cube.location = location
+    cube.scale = scale
+    cube.rotation_euler = rotation
+    bpy.context.collection.objects.link(cube)
+    
+    return cube
+
+
+def apply_modifiers(target_object):
+    """
+    Applies all the modifiers of the target object.
+    """
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    mesh = bpy.data.meshes.new_from_object(target_object.evaluated_get(depsgraph))
+    
+    # Swap the mesh and remove the modifiers that are now baked into it.
+    old_mesh = target_object.data
+    target_object.data = mesh
+    target_object.modifiers.clear()
+    
+    if old_mesh.users == 0:
+        bpy.data.meshes.remove(old_mesh)
+
+
+def delete_object(target_object):
+    """
+    Deletes the target object along with its mesh.
+    """
+    mesh = target_object.data
+    bpy.data.objects.remove(target_object, do_unlink=True)
+    
+    if mesh.users == 0:
+        bpy.data.meshes.remove(mesh)
+
+
 @timing
-def copy(target_object):
+def copy(target_object, mesh=None):
     """
-    Copy the active object in place.
+    Copy the target object in place.
+    :param mesh: The mesh to give the copy a copy of. Defaults to the mesh of the target object.
     """
-    bpy.ops.object.duplicate(linked=False)
-    return bpy.context.active_object
+    if mesh is None:
+        mesh = target_object.data
+        
+    new_object = target_object.copy()
+    new_object.data = mesh.copy()
+    
+    # Link the copy to the same collections as the target.
+    for collection in target_object.users_collection:
+        collection.objects.link(new_object)
+    
+    # Select only the copy and set it to be the active object, like the duplicate operator does.
+    deselect_all()
+    new_object.select_set(True)
+    bpy.context.view_layer.objects.active = new_object
+    
+    return new_object
     
     
 @timing
@@ -223,25 +337,18 @@ def remove_over_xy_plane(target_object, z_offset, dimensions):
     max_z = max(abs(dimensions[2]), abs(dimensions[5])) + 10
 
     # Add cube that covers the part of the model that is above the XY plane.
-    bpy.ops.mesh.primitive_cube_add(size=2, enter_editmode=False, align='WORLD', location=(0, 0, max_z + z_offset), scale=(max_x, max_y, max_z))
-    boolean_cube = bpy.context.selected_objects[0]
-    boolean_cube.name = 'boolean_cube'
-    
-    # Deselect all and set the active object to be the target again.
-    bpy.ops.object.select_all(action='DESELECT')
-    bpy.context.view_layer.objects.active = target_object
+    boolean_cube = add_cube('boolean_cube', size=2, location=(0, 0, max_z + z_offset), scale=(max_x, max_y, max_z))
     
-    # Add a boolean modifier to the target object and set it to be the boolean cube.
+    # Add a boolean modifier to the target object, set it to difference operation and set it to be the boolean cube.
     mod_bool = target_object.modifiers.new('Boolean', 'BOOLEAN')
+    mod_bool.operation = 'DIFFERENCE'
     mod_bool.object = boolean_cube
     
     # Apply the modifier.
-    bpy.ops.object.modifier_apply(modifier=target_object.modifiers[0].name)
+    apply_modifiers(target_object)
     
     # Delete the boolean cube.
-    bpy.ops.object.select_all(action='DESELECT')
-    boolean_cube.select_set(True)
-    bpy.ops.object.delete()
+    delete_object(boolean_cube)
     
     
 @timing  
@@ -250,7 +357,9 @@ def add_attach_port(target_object, z_offset, dimensions):
     Adds an attach port location to the model.
     Should be used before the convex hull operation.
     """
-    print("dimensions:", dimensions)
+    if DEBUG:
+        print("dimensions:", dimensions)
+        
     # Get max x to know where to put the port. + 1 to be a bit further.
     port_x = dimensions[0] + 1
     
@@ -263,82 +372,71 @@ def add_attach_port(target_object, z_offset, dimensions):
     # Calculate the port y.
     port_y = (dimensions[1] + dimensions[4]) / 2
     
-    # Add port cube.
-    bpy.ops.mesh.primitive_cube_add(size=1, enter_editmode=False, align='WORLD', location=(port_x, port_y, -port_height/2 + z_offset), scale=(1, port_width, port_height))
-    port_cube = bpy.context.selected_objects[0]
-    port_cube.name = 'port_cube'
-    
-    # Rotate the port just a bit so it remains after removing the blocking faces.
-    bpy.ops.transform.rotate(value=radians(-2), orient_axis='Y')
-    
-    # Deselect all and set the active object to be the target again.
-    bpy.ops.object.select_all(action='DESELECT')
-    bpy.context.view_layer.objects.active = target_object
+    # Add port cube, tilted 2 degrees around Y so it remains after removing the blocking faces.
+    port_cube = add_cube('port_cube', size=1, location=(port_x, port_y, -port_height/2 + z_offset), scale=(1, port_width, port_height), rotation=(0, radians(2), 0))
     
     # Add a boolean modifier to the target object, change it to union operation and set it to be the port cube.
     mod_bool = target_object.modifiers.new('Boolean', 'BOOLEAN')
-    bpy.context.object.modifiers["Boolean"].operation = 'UNION'
+    mod_bool.operation = 'UNION'
     mod_bool.object = port_cube
 
     # Apply the modifier.
-    bpy.ops.object.modifier_apply(modifier=target_object.modifiers[0].name)
+    apply_modifiers(target_object)
     
     # Delete the port cube.
-    bpy.ops.object.select_all(action='DESELECT')
-    port_cube.select_set(True)
-    bpy.ops.object.delete()
+    delete_object(port_cube)
     
     
 @timing
-def convex_hull(target_object):
+def build_shell(target_object):
     """
-    Calculates the convex hull of the given target object.
+    Builds the shell of the target object: its convex hull without the faces that block the object from sliding out.
+    Both steps run on a single bmesh, so the mesh is converted only once.
     """
-    # Set the target object to be the active object.
-    bpy.context.view_layer.objects.active = target_object
+    bm = bmesh.new()
+    bm.from_mesh(target_object.data)
     
-    # Set the object to edit mode and calculate the convex hull 
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.mesh.convex_hull()
-    bpy.ops.object.mode_set(mode='OBJECT')
+    # Calculate the convex hull.
+    convex_hull(bm)
+    
+    # Remove all faces that restrict the object from being pulled straight up.
+    delete_blocking_faces(bm, target_object.rotation_euler.to_matrix())
+    
+    # Write the shell back to the mesh.
+    bm.to_mesh(target_object.data)
+    bm.free()
 
 
 @timing
-def delete_blocking_faces(target_object):
+def convex_hull(bm):
     """
-    Deletes all faces with normals that are more than 90 degrees to the positive Z direction.
-    Essentially, removing all faces that block the object from sliding straight up.
+    Calculates the convex hull of the given bmesh.
     """
-    # Set the target object to be the active object.
-    bpy.context.view_layer.objects.active = target_object
-    
-    # Get all bad faces.
-    up = Vector((0, 0, 1))
-    test_angle = radians(90)
+    # Calculate the convex hull of all the geometry and remove everything that is not part of it.
+    hull = bmesh.ops.convex_hull(bm, input=bm.verts[:] + bm.edges[:] + bm.faces[:], use_existing_faces=True)
+    bmesh.ops.delete(bm, geom=hull['geom_unused'], context='TAGGED_ONLY')
     
-    # List all faces with normal less than 90 degrees up.
-    faces = [f.index for f in target_object.data.polygons
-             if (target_object.rotation_euler.to_matrix() @ f.normal).angle(up) < test_angle]
+    # Join the hull triangles like the convex hull operator does by default.
+    hull_faces = [f for f in hull['geom'] if isinstance(f, bmesh.types.BMFace)]
+    bmesh.ops.join_triangles(bm, faces=hull_faces, angle_face_threshold=radians(40), angle_shape_threshold=radians(40))
 
-    # Deselect everything.
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_all(action='DESELECT')
-
-    # Reselect the originally selected faces.
-    bpy.ops.object.mode_set(mode='OBJECT')
-    for face_idx in faces:
-        target_object.data.polygons[face_idx].select = True
-        
-    # Delete selected faces.
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.delete(type='FACE')
 
-    # Reselect all.
-    bpy.ops.mesh.select_all(action='SELECT')
+@timing
+def delete_blocking_faces(bm, rotation):
+    """
+    Deletes all faces with normals that are less than 90 degrees to the positive Z direction.
+    Essentially, removing all faces that block the object from sliding straight up.
+    :param rotation: The rotation matrix of the object the bmesh belongs to.
+    """
+    bm.normal_update()
     
-    # Change back to object mode.
-    bpy.ops.object.mode_set(mode='OBJECT')
+    # A rotated normal is less than 90 degrees from up exactly when its z component is positive,
+    # and that z component is the dot product with the last row of the rotation matrix.
+    up_row = rotation.row[2]
+    faces = [f for f in bm.faces if up_row.dot(f.normal) > 0]
+    
+    # Delete the blocking faces.
+    bmesh.ops.delete(bm, geom=faces, context='FACES')
 
 
 @timing
@@ -349,8 +447,9 @@ def thicken_shell(target_object, thickness):
     # Set the target object to be the active object.
     bpy.context.view_layer.objects.active = target_object
     
-    # Extrude along the normals.
+    # Select the whole shell and extrude it along the normals.
     bpy.ops.object.mode_set(mode='EDIT')
+    bpy.ops.mesh.select_all(action='SELECT')
     bpy.ops.mesh.extrude_region_shrink_fatten(MESH_OT_extrude_region={"use_normal_flip":False, "use_dissolve_ortho_edges":False, "mirror":False}, TRANSFORM_OT_shrink_fatten={"value":thickness, "use_even_offset":False, "mirror":False, "use_proportional_edit":False, "proportional_edit_falloff":'SMOOTH', "proportional_size":1, "use_proportional_connected":False, "use_proportional_projected":False, "snap":False, "release_confirm":True, "use_accurate":False})
     bpy.ops.object.mode_set(mode='OBJECT')
 
@@ -369,9 +468,9 @@ def apply_subsurf_modifier(target_object):
     """
     Add subsurf modifier and apply it to to the target object.
     """
-    mod_bool = target_object.modifiers.new('subsurf', 'SUBSURF')
-    target_object.modifiers[0].levels = 2
-    bpy.ops.object.modifier_apply(modifier=target_object.modifiers[0].name)
+    mod_subsurf = target_object.modifiers.new('subsurf', 'SUBSURF')
+    mod_subsurf.levels = 2
+    apply_modifiers(target_object)
 
 
 @timing
@@ -380,40 +479,84 @@ def get_attach_port_vertices(target_object, type, dimensions):
     Selects the port vertices and returns them.
     use type to specify hanger or holder with HANGER, HOLDER.
     """
+    # Deselect all edges and faces. The vertices selection is set below.
+    mesh = target_object.data
+    mesh.edges.foreach_set("select", np.zeros(len(mesh.edges), dtype=np.int8))
+    mesh.polygons.foreach_set("select", np.zeros(len(mesh.polygons), dtype=np.int8))
     
-    # Deselect all vertices.
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_all(action='DESELECT')
-    bpy.ops.object.mode_set(mode='OBJECT')
-    
-    # Get the 4 vertices. Note that if we calculate for the  hanger we don't want to reverse.
-    vertices_tmp = sorted(target_object.data.vertices, reverse=type=='HOLDER', key=lambda v: (target_object.matrix_world @ v.co).x)
+    # Get the x world coordinate of every vertex.
+    coords = local_coords(target_object)
+    world_x = world_coords(target_object, coords)[:, 0]
     
+    # Get the 4 vertices. Note that for the hanger we want the smallest x and for the holder the biggest.
     if type == 'HANGER':
-        vertices = vertices_tmp[:4]
+        indices = np.argpartition(world_x, min(3, len(world_x) - 1))[:4]
     
     else:
         threshold = min(dimensions[1] - dimensions[4], dimensions[2] - dimensions[5]) / 10
-        vertices = []
-        for v in vertices_tmp:
-            accepted = True
-            for v0 in vertices:
-                if (v.co - v0.co).length < threshold:
-                    accepted = False
-                    break
-            if accepted:
-                vertices.append(v)
-                
-            if len(vertices) == 4:
-                break
+        candidates = np.arange(len(world_x))
+        indices = []
+        while len(candidates) > 0 and len(indices) < 4:
+            # Accept the candidate with the biggest x and drop all the candidates that are too close to it.
+            i = candidates[np.argmax(world_x[candidates])]
+            indices.append(i)
+            far = np.linalg.norm(coords[candidates] - coords[i], axis=1) >= threshold
+            candidates = candidates[far & (candidates != i)]
         
     # Set the attach ports selected.
-    for v in vertices:
-        v.select = True
+    selection = np.zeros(len(world_x), dtype=np.int8)
+    selection[indices] = 1
+    target_object.data.vertices.foreach_set("select", selection)
+    
+    vertices = [target_object.data.vertices[int(i)] for i in indices]
         
     return vertices
 
 
+def import_stl(filepath):
+    """
+    Imports an stl file and returns the new object, selected and active like the stl import operator leaves it.
+    Reads the file with the stl addon reader and builds the mesh directly, skipping the operator when the reader is available.
+    """
+    try:
+        from io_mesh_stl import stl_utils
+    except ImportError:
+        bpy.ops.import_mesh.stl(filepath=filepath)
+        return bpy.context.active_object
+    
+    # Read the triangles and the (deduplicated) points.
+    tris, _, pts = stl_utils.read_stl(filepath)
+    vertex_indices = np.asarray(tris, dtype=np.int32).ravel()
+    
+    # Build the mesh from the buffers in one go.
+    name = bpy.path.display_name_from_filepath(filepath)
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(pts))
+    mesh.vertices.foreach_set("co", np.asarray(pts, dtype=np.float32).ravel())
+    mesh.loops.add(len(vertex_indices))
+    mesh.loops.foreach_set("vertex_index", vertex_indices)
+    mesh.polygons.add(len(tris))
+    mesh.polygons.foreach_set("loop_start", np.arange(0, len(vertex_indices), 3, dtype=np.int32))
+    
+    # Newer blender versions derive the face sizes from loop_start and don't allow setting them.
+    if not bpy.types.MeshPolygon.bl_rna.properties['loop_total'].is_readonly:
+        mesh.polygons.foreach_set("loop_total", np.full(len(tris), 3, dtype=np.int32))
+        
+    mesh.update(calc_edges=True)
+    mesh.validate()
+    mesh.update()
+    
+    obj = bpy.data.objects.new(name, mesh)
+    bpy.context.collection.objects.link(obj)
+    
+    # Select only the new object and set it to be the active object.
+    deselect_all()
+    obj.select_set(True)
+    bpy.context.view_layer.objects.active = obj
+    
+    return obj
+
+
 @timing
 def import_hanger(type, hanger_rotation, hangers_dir_path):
     """
@@ -430,14 +573,33 @@ def import_hanger(type, hanger_rotation, hangers_dir_path):
         "RING": hangers_dir_path + "ring_mount.stl"
     }
     
-    # Import the stl.
-    bpy.ops.import_mesh.stl(filepath=hanger_file_paths[type])
+    # Reuse the hanger mesh if it was already imported.
+    hanger_key = (type, hangers_dir_path)
+    cached_mesh = bpy.data.meshes.get(hanger_mesh_names.get(hanger_key, ''))
+    if cached_mesh is not None and cached_mesh.get(HANGER_KEY_TAG) == str(hanger_key):
+        hanger_mesh = cached_mesh.copy()
+        del hanger_mesh[HANGER_KEY_TAG]
+        
+        hanger_name = bpy.path.display_name_from_filepath(hanger_file_paths[type])
+        hanger = bpy.data.objects.new(hanger_name, hanger_mesh)
+        bpy.context.collection.objects.link(hanger)
+        
+        # Select only the hanger and set it to be the active object, like the import does.
+        deselect_all()
+        hanger.select_set(True)
+        bpy.context.view_layer.objects.active = hanger
     
-    # Keep the hanger object.
-    hanger = bpy.context.active_object
+    else:
+        # Import the stl.
+        hanger = import_stl(hanger_file_paths[type])
+        
+        # Keep an untouched copy of the mesh, the hanger mesh itself is changed when it is joined with the holder.
+        cached_mesh = hanger.data.copy()
+        cached_mesh[HANGER_KEY_TAG] = str(hanger_key)
+        hanger_mesh_names[hanger_key] = cached_mesh.name
     
-    # Rotate the hanger on the X axis by the specified degrees.
-    bpy.ops.transform.rotate(value=radians(hanger_rotation), orient_axis='X')
+    # Rotate the hanger on the X axis by the specified degrees, clockwise when looking at it from the positive X side.
+    hanger.rotation_euler.x = -radians(hanger_rotation)
 
     return hanger
 
@@ -464,36 +626,36 @@ def connect_holder_hanger(holder, holder_port_vertices, hanger, hanger_port_vert
     bpy.ops.object.mode_set(mode='OBJECT')
 
 
-@timing
-def generate_holder(z_offset = 0, shell_scaleup = 1.05, wall_thickness = 10, hanger_rotation = 0, hanger_type = "TABLE", hanger_dir_path="E:\\Projects\\3DCourse\\files\\mounts\\"):
+def get_shell_key(target_object, z_offset, shell_scaleup, wall_thickness):
     """
-    Runs the logic of the program.
-    :param z_offset: The offset from the z=0 plane where above it the hanger will not be created.
-    :param shell_scaleup: How much to scale up the shell to have space for the object. Shouldn't be smaller than 1. the bigger it is the more space the object will have.
-    :param wall_thickness: The thickness of the shell wall. Will determine how strong the holder is.
-    :param hanger_rotation: X rotation of the hanger (to hang on tables or cylinders with different angles).
-    :param hanger_type: The type of the hanger to use. shoud be on of {TABLE, RING, WALL}
+    Returns a key that identifies the holder shell generated for the target object with the given parameters.
+    The evaluated mesh is hashed, since the modifiers of the target object are applied to the shell.
     """
-    # Make sure that the hangers folder is selected.
-    if not hanger_dir_path:
-        ShowMessageBox("Please select the folder that contains the hanger files. It came with the git repo you cloned.", "Hanger Directory Not Selected", 'ERROR')
-        return
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    evaluated_object = target_object.evaluated_get(depsgraph)
+    mesh = evaluated_object.to_mesh()
     
-    # Check that a target object is selected.
-    if not bpy.context.active_object:
-        ShowMessageBox("Please select the object you would like to generate a holder for.", "Target Object Not Selected", 'ERROR')
-        return
+    coords = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", coords)
+    vertex_indices = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", vertex_indices)
+    num_polygons = len(mesh.polygons)
+    evaluated_object.to_mesh_clear()
     
-    # Check that the addon 3D print toolbox is installed.
-    if 'object_print3d_utils' not in bpy.context.preferences.addons.keys():
-        ShowMessageBox("Please install the addon mesh:3D-print-toolbox from the addon preferences.", "3D-print-toolbox not installed", 'ERROR')
-        return
-    
-    # Save target object.
-    limit_object = bpy.context.active_object
+    matrix = np.array(target_object.matrix_world, dtype=np.float32)
     
+    mesh_hash = hash((coords.tobytes(), vertex_indices.tobytes(), num_polygons, matrix.tobytes()))
+    return mesh_hash, z_offset, shell_scaleup, wall_thickness
+
+
+@timing
+def generate_shell(target_object, z_offset, shell_scaleup, wall_thickness):
+    """
+    Generates the holder shell from a copy of the target object.
+    Returns the shell object and its dimensions, or None, None if the shell couldn't be generated.
+    """
     # Copy the target object.
-    holder = copy(limit_object)
+    holder = copy(target_object)
     
     # Get the dimensions.
     dimensions = get_mins_maxs(holder)
@@ -506,10 +668,8 @@ def generate_holder(z_offset = 0, shell_scaleup = 1.05, wall_thickness = 10, han
         ShowMessageBox("Z-offset not covering the object.", "Bad Z-Offset", 'ERROR')
         
         # Delete the holder.
-        bpy.ops.object.select_all(action='DESELECT')
-        holder.select_set(True)
-        bpy.ops.object.delete()
-        return
+        delete_object(holder)
+        return None, None
     
     # Get the dimensions.
     dimensions = get_mins_maxs(holder)
@@ -517,11 +677,8 @@ def generate_holder(z_offset = 0, shell_scaleup = 1.05, wall_thickness = 10, han
     # boolean a connection port to the object.
     add_attach_port(holder, z_offset, dimensions)
     
-    # Calculate the convex hull.
-    convex_hull(holder)
-    
-    # Remove all faces that restrict the object from being pulled straight up.
-    delete_blocking_faces(holder)
+    # Calculate the convex hull and remove all faces that restrict the object from being pulled straight up.
+    build_shell(holder)
     
     # Scale the shell a bit.
     uniform_scale(holder, shell_scaleup)
@@ -529,6 +686,83 @@ def generate_holder(z_offset = 0, shell_scaleup = 1.05, wall_thickness = 10, han
     # Thicken the shell to create walls.
     thicken_shell(holder, wall_thickness)
     
+    return holder, dimensions
+
+
+@timing
+def get_holder_shell(target_object, z_offset, shell_scaleup, wall_thickness):
+    """
+    Returns the holder shell for the target object and its dimensions, or None, None if it couldn't be generated.
+    The last generated shell is kept, so re-generating with only different hanger parameters doesn't rebuild it.
+    """
+    shell_key = get_shell_key(target_object, z_offset, shell_scaleup, wall_thickness)
+    
+    # Reuse the last shell if it was generated for the same object and parameters.
+    mesh_name, dimensions = shell_cache.get(shell_key, ('', None))
+    cached_mesh = bpy.data.meshes.get(mesh_name)
+    if cached_mesh is not None and cached_mesh.get(SHELL_KEY_TAG) == str(shell_key):
+        holder = copy(target_object, cached_mesh)
+        del holder.data[SHELL_KEY_TAG]
+        
+        # The modifiers are already applied in the cached shell.
+        holder.modifiers.clear()
+        uniform_scale(holder, shell_scaleup)
+        
+        # Update the world matrix to the new scale, the port vertices are picked by their world coordinates.
+        bpy.context.view_layer.update()
+        return holder, dimensions
+    
+    holder, dimensions = generate_shell(target_object, z_offset, shell_scaleup, wall_thickness)
+    if holder is None:
+        return None, None
+    
+    # Replace the last shell with a copy of this one. The holder mesh itself is changed when it is joined with the hanger.
+    for old_key, (old_mesh_name, _) in shell_cache.items():
+        old_mesh = bpy.data.meshes.get(old_mesh_name)
+        if old_mesh is not None and old_mesh.get(SHELL_KEY_TAG) == str(old_key) and old_mesh.users == 0:
+            bpy.data.meshes.remove(old_mesh)
+    
+    shell_mesh = holder.data.copy()
+    shell_mesh[SHELL_KEY_TAG] = str(shell_key)
+    shell_cache.clear()
+    shell_cache[shell_key] = (shell_mesh.name, dimensions)
+    
+    return holder, dimensions
+
+
+@timing
+def generate_holder(z_offset = 0, shell_scaleup = 1.05, wall_thickness = 10, hanger_rotation = 0, hanger_type = "TABLE", hanger_dir_path="E:\\Projects\\3DCourse\\files\\mounts\\"):
+    """
+    Runs the logic of the program.
+    :param z_offset: The offset from the z=0 plane where above it the hanger will not be created.
+    :param shell_scaleup: How much to scale up the shell to have space for the object. Shouldn't be smaller than 1. the bigger it is the more space the object will have.
+    :param wall_thickness: The thickness of the shell wall. Will determine how strong the holder is.
+    :param hanger_rotation: X rotation of the hanger (to hang on tables or cylinders with different angles).
+    :param hanger_type: The type of the hanger to use. shoud be on of {TABLE, RING, WALL}
+    """
+    # Make sure that the hangers folder is selected.
+    if not hanger_dir_path:
+        ShowMessageBox("Please select the folder that contains the hanger files. It came with the git repo you cloned.", "Hanger Directory Not Selected", 'ERROR')
+        return
+    
+    # Check that a target object is selected.
+    if not bpy.context.active_object:
+        ShowMessageBox("Please select the object you would like to generate a holder for.", "Target Object Not Selected", 'ERROR')
+        return
+    
+    # Check that the addon 3D print toolbox is installed.
+    if 'object_print3d_utils' not in bpy.context.preferences.addons.keys():
+        ShowMessageBox("Please install the addon mesh:3D-print-toolbox from the addon preferences.", "3D-print-toolbox not installed", 'ERROR')
+        return
+    
+    # Save target object.
+    limit_object = bpy.context.active_object
+    
+    # Get the holder shell.
+    holder, dimensions = get_holder_shell(limit_object, z_offset, shell_scaleup, wall_thickness)
+    if holder is None:
+        return
+    
     # Get the attach port vertices.
     holder_port_vertices = get_attach_port_vertices(holder, 'HOLDER', dimensions)
     